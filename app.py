@@ -36,6 +36,10 @@ with app.app_context():
     # Create database tables
     db.create_all()
     
+    # Background jobs run with their own application context
+    from jobs import job_runner
+    job_runner.init_app(app)
+    
     # Import and register routes
     from routes import init_routes
     init_routes(app)
@@ -0,0 +1,204 @@
+"""
+Walk-forward backtest of the prediction model.
+
+Replays the feature store season by season. Each test season is predicted in
+blocks of `retrain_days`; before every block the model is retrained on games
+played strictly before it, using point-in-time features only. Independent
+folds (season, and optionally league) run in a process pool.
+
+Usage:
+    python backtest.py --retrain-days 30 --workers 8 --by-league
+"""
+import os
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app import app
+from models import Team
+from feature_store import FeatureStore, seasons_of
+from season_stats import load_season_stats
+from prediction import build_feature_matrix, train_models, outcome_probabilities, HOME_ADVANTAGE
+
+# Minimum number of training games before the model is used instead of the simplified formula
+MIN_TRAINING_GAMES = 10
+
+# Outcome indices used for the 1X2 metrics
+HOME_WIN, DRAW, AWAY_WIN = 0, 1, 2
+
+
+def _actual_outcomes(home_scores, away_scores):
+    return np.where(home_scores > away_scores, HOME_WIN, np.where(home_scores < away_scores, AWAY_WIN, DRAW))
+
+
+def score_predictions(pred_home, pred_away, home_scores, away_scores):
+    """
+    Score predicted results against actual ones.
+
+    Returns:
+        dict: games, 1X2 accuracy, log-loss, Brier score and score MAE.
+    """
+    home_win_prob, away_win_prob, draw_prob = outcome_probabilities(pred_home, pred_away)
+    probabilities = np.column_stack([home_win_prob, draw_prob, away_win_prob])
+    outcomes = _actual_outcomes(home_scores, away_scores)
+    one_hot = np.eye(3)[outcomes]
+
+    actual_prob = np.clip(probabilities[np.arange(len(outcomes)), outcomes], 1e-15, 1)
+
+    return {
+        'games': len(outcomes),
+        'accuracy': float(np.mean(probabilities.argmax(axis=1) == outcomes)),
+        'log_loss': float(-np.mean(np.log(actual_prob))),
+        'brier': float(np.mean(np.sum((probabilities - one_hot) ** 2, axis=1))),
+        'score_mae': float(np.mean((np.abs(pred_home - home_scores) + np.abs(pred_away - away_scores)) / 2)),
+    }
+
+
+def _run_fold(fold):
+    """Walk forward through one test season (and league). Runs in a worker process."""
+    season, league, retrain_days, n_estimators, store_root, league_of_team = fold
+
+    data = FeatureStore(store_root).load()
+    season_stats = load_season_stats(store_root)
+    seasons = seasons_of(data['date'])
+
+    in_league = np.ones(len(seasons), dtype=bool)
+    if league is not None:
+        in_league = league_of_team[data['home_team_id']] == league
+
+    # Same features as production, so the scores describe the served model
+    X = build_feature_matrix(
+        data['home_avg_score'], data['away_avg_score'],
+        data['home_team_id'], data['away_team_id'],
+        seasons, season_stats
+    )
+    home_scores = np.asarray(data['home_score'], dtype=np.float64)
+    away_scores = np.asarray(data['away_score'], dtype=np.float64)
+
+    test = np.flatnonzero((seasons == season) & in_league)
+    pred_home = np.empty(len(test))
+    pred_away = np.empty(len(test))
+    step = np.timedelta64(retrain_days, 'D')
+
+    start = 0
+    while start < len(test):
+        block_start = data['date'][test[start]]
+        end = int(np.searchsorted(data['date'][test], block_start + step, side='left'))
+        block = test[start:end]
+
+        # Rows are in date order, so everything before the block is a prefix
+        train = np.flatnonzero(in_league[:int(np.searchsorted(data['date'], block_start, side='left'))])
+
+        if len(train) >= MIN_TRAINING_GAMES:
+            model = train_models(X[train], home_scores[train], away_scores[train], n_estimators=n_estimators, n_jobs=1)
+            pred_home[start:end] = model['home_model'].predict(X[block])
+            pred_away[start:end] = model['away_model'].predict(X[block])
+        else:
+            pred_home[start:end] = X[block, 0] * (1 + HOME_ADVANTAGE)
+            pred_away[start:end] = X[block, 1] * (1 - HOME_ADVANTAGE)
+
+        start = end
+
+    pred_home = np.maximum(pred_home, 0)
+    pred_away = np.maximum(pred_away, 0)
+
+    return season, league, pred_home, pred_away, home_scores[test], away_scores[test]
+
+
+def run_backtest(retrain_days=30, n_estimators=100, workers=None, by_league=False, seasons=None, store_root=None):
+    """
+    Run the walk-forward backtest.
+
+    Args:
+        retrain_days: Days between model retrains within a test season.
+        n_estimators: Trees per forest.
+        workers: Number of worker processes. Defaults to the CPU count.
+        by_league: Run every league (team division) as a separate fold.
+        seasons: Optional list of test seasons. Defaults to every stored season.
+        store_root: Optional feature store directory.
+
+    Returns:
+        dict: Metrics per fold and overall.
+    """
+    store = FeatureStore(store_root)
+    store_root = store.root
+    test_seasons = seasons or store.seasons()
+
+    leagues = [None]
+    league_of_team = None
+    if by_league:
+        teams = Team.query.with_entities(Team.id, Team.division).all()
+        divisions = sorted({division or '' for _, division in teams})
+        league_of_team = np.full(max([team_id for team_id, _ in teams], default=0) + 1, -1, dtype=np.int32)
+        for team_id, division in teams:
+            league_of_team[team_id] = divisions.index(division or '')
+        leagues = list(range(len(divisions)))
+    else:
+        divisions = []
+
+    folds = [
+        (season, league, retrain_days, n_estimators, store_root, league_of_team)
+        for season in test_seasons
+        for league in leagues
+    ]
+
+    results = {'folds': [], 'overall': None}
+    all_predictions = []
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for season, league, pred_home, pred_away, home_scores, away_scores in executor.map(_run_fold, folds):
+            if not len(home_scores):
+                continue
+            metrics = score_predictions(pred_home, pred_away, home_scores, away_scores)
+            metrics['season'] = season
+            metrics['league'] = divisions[league] if league is not None else None
+            results['folds'].append(metrics)
+            all_predictions.append((pred_home, pred_away, home_scores, away_scores))
+
+    if all_predictions:
+        results['overall'] = score_predictions(*(np.concatenate(parts) for parts in zip(*all_predictions)))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the prediction model.")
+    parser.add_argument('--retrain-days', type=int, default=30, help="Days between retrains within a season")
+    parser.add_argument('--n-estimators', type=int, default=100, help="Trees per random forest")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--by-league', action='store_true', help="Evaluate every league as a separate fold")
+    parser.add_argument('--seasons', type=int, nargs='*', help="Test seasons (default: all)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        FeatureStore().sync()
+        results = run_backtest(
+            retrain_days=args.retrain_days,
+            n_estimators=args.n_estimators,
+            workers=args.workers,
+            by_league=args.by_league,
+            seasons=args.seasons
+        )
+
+    header = f"{'season':>6}  {'league':<20} {'games':>6} {'acc':>6} {'logloss':>8} {'brier':>6} {'mae':>6}"
+    print(header)
+    print('-' * len(header))
+    for fold in results['folds']:
+        print(f"{fold['season']:>6}  {(fold['league'] or 'all'):<20} {fold['games']:>6} {fold['accuracy']:>6.3f} "
+              f"{fold['log_loss']:>8.3f} {fold['brier']:>6.3f} {fold['score_mae']:>6.2f}")
+
+    overall = results['overall']
+    if overall:
+        print('-' * len(header))
+        print(f"{'total':>6}  {'':<20} {overall['games']:>6} {overall['accuracy']:>6.3f} "
+              f"{overall['log_loss']:>8.3f} {overall['brier']:>6.3f} {overall['score_mae']:>6.2f}")
+    else:
+        print("No settled games in the feature store.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.http import http_date
+
+from config import CACHE_TIMEOUT, RESPONSE_CACHE_SIZE, CACHE_REDIS_URL, CACHE_TAG_PATH
+
+try:
+    import redis
+except ImportError:  # Optional shared backend
+    redis = None
+
+
+class LocalBackend:
+    """
+    In-process LRU store with per-entry expiry.
+
+    Entries are kept in this process, but table versions are small files
+    under `tag_dir`, so a write in any worker on the same host invalidates
+    the entries of every worker. Instances on separate hosts need the Redis
+    backend.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, tag_dir=CACHE_TAG_PATH):
+        self.max_entries = max_entries
+        self.tag_dir = tag_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_tags(self, tags):
+        versions = []
+        for tag in tags:
+            try:
+                with open(os.path.join(self.tag_dir, tag)) as tag_file:
+                    versions.append(float(tag_file.read()))
+            except (OSError, ValueError):
+                versions.append(None)
+        return versions
+
+    def set_tag(self, tag, version):
+        os.makedirs(self.tag_dir, exist_ok=True)
+        path = os.path.join(self.tag_dir, tag)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as tag_file:
+            tag_file.write(repr(version))
+        os.replace(tmp_path, path)
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.time() + timeout if timeout else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Shared store so every worker sees the same entries and invalidations."""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = 'response-cache:'
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def get_tags(self, tags):
+        values = self.client.mget([self.prefix + 'tag:' + tag for tag in tags])
+        return [float(value) if value is not None else None for value in values]
+
+    def set_tag(self, tag, version):
+        self.client.set(self.prefix + 'tag:' + tag, version)
+
+    def set(self, key, value, timeout=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=timeout or None)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + 'view:*'):
+            self.client.delete(key)
+
+
+class ResponseCache:
+    """
+    Cache of rendered responses invalidated by database table tags.
+
+    Every cached view declares the tables it reads. Each table has a version
+    (the time it was last written), which is part of the cache key, so a
+    write to a table makes all entries depending on it unreachable.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalBackend()
+        self._started_at = time.time()
+
+    def tag_versions(self, tags):
+        versions = self.backend.get_tags(tags)
+        return [version or self._started_at for version in versions]
+
+    def invalidate(self, *tags):
+        now = time.time()
+        for tag in tags:
+            self.backend.set_tag(tag, now)
+
+    def clear(self):
+        self.backend.clear()
+
+    def cached(self, *tags, timeout=CACHE_TIMEOUT, unless=None, vary=None):
+        """
+        Decorator caching a GET view until one of the given tables is written.
+
+        Responses carry ETag and Last-Modified headers, and conditional
+        requests are answered with 304 Not Modified. The cache is bypassed
+        when `unless()` is true, and responses marked no-store are not kept.
+        `vary()` returns a string added to the cache key, for views that also
+        depend on state outside the database (e.g. the trained model).
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pages rendering flashed messages are specific to this visitor
+                if request.method != 'GET' or session.get('_flashes') or (unless and unless()):
+                    return view(*args, **kwargs)
+
+                try:
+                    versions = self.tag_versions(tags)
+                    key = _cache_key(request.full_path, versions)
+                    if vary:
+                        key += ':' + vary()
+                    entry = self.backend.get(key)
+                except Exception as e:
+                    logging.error(f"Response cache unavailable: {str(e)}")
+                    return view(*args, **kwargs)
+
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.direct_passthrough or response.cache_control.no_store:
+                        return response
+
+                    body = response.get_data()
+                    entry = {
+                        'body': body,
+                        'mimetype': response.mimetype,
+                        'etag': hashlib.md5(body).hexdigest(),
+                        'last_modified': max(versions),
+                    }
+                    try:
+                        self.backend.set(key, entry, timeout)
+                    except Exception as e:
+                        logging.error(f"Response cache unavailable: {str(e)}")
+
+                return _conditional_response(entry)
+            return wrapper
+        return decorator
+
+
+def _cache_key(path, versions):
+    return 'view:' + path + ':' + ':'.join(repr(version) for version in versions)
+
+
+def _conditional_response(entry):
+    """Build the response for a cache entry, honouring If-None-Match/If-Modified-Since."""
+    last_modified = int(entry['last_modified'])
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(entry['etag'])
+    elif request.if_modified_since:
+        not_modified = int(request.if_modified_since.timestamp()) >= last_modified
+    else:
+        not_modified = False
+
+    if not_modified:
+        response = make_response('', 304)
+    else:
+        response = make_response(entry['body'])
+        response.mimetype = entry['mimetype']
+
+    response.set_etag(entry['etag'])
+    response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _create_backend():
+    if CACHE_REDIS_URL:
+        if redis is None:
+            logging.warning("CACHE_REDIS_URL is set but redis is not installed. Using in-process cache.")
+        else:
+            return RedisBackend(CACHE_REDIS_URL)
+    return LocalBackend()
+
+
+response_cache = ResponseCache(_create_backend())
+
+
+# Invalidate cached pages when the tables they read are committed to
+@event.listens_for(Session, 'after_flush')
+def _collect_written_tables(db_session, flush_context):
+    written = db_session.info.setdefault('written_tables', set())
+    for instance in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        table = getattr(instance, '__tablename__', None)
+        if table:
+            written.add(table)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_written_tables(db_session):
+    written = db_session.info.pop('written_tables', None)
+    if written:
+        try:
+            response_cache.invalidate(*written)
+        except Exception as e:
+            logging.error(f"Error invalidating response cache: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_written_tables(db_session):
+    db_session.info.pop('written_tables', None)
@@ -18,4 +18,34 @@ DEFAULT_LEAGUES = [
 
 # Application configuration
 DEBUG = True
-CACHE_TIMEOUT = 3600  # 1 hour
\ No newline at end of file
+CACHE_TIMEOUT = 3600  # 1 hour
+
+# Rendered response cache (in-process LRU, or shared via Redis when configured)
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 512))
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+# Table versions of the in-process cache, shared by all workers on this host
+CACHE_TAG_PATH = os.environ.get(
+    'CACHE_TAG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'cache_tags')
+)
+
+# Columnar feature store for training and analysis
+FEATURE_STORE_PATH = os.environ.get(
+    'FEATURE_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'feature_store')
+)
+
+# How often team season statistics and top scorers are refetched (seconds)
+SEASON_STATS_REFRESH_INTERVAL = int(os.environ.get('SEASON_STATS_REFRESH_INTERVAL', 6 * 3600))
+
+# Background jobs (e.g. Sportmonks team sync) run outside the request cycle
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_HISTORY_SIZE = 100
+
+# Monte Carlo season simulation
+# 1 runs in-process, the safe choice inside web workers; more shard across a long-lived process pool (0 = CPU count)
+SIMULATION_WORKERS = int(os.environ.get('SIMULATION_WORKERS', 1))
+MAX_SIMULATIONS = 200000
+
+# Serve predictions from compiled, array-backed forests instead of sklearn objects
+COMPILED_INFERENCE = os.environ.get('COMPILED_INFERENCE', '1') == '1'
+COMPILED_INFERENCE_PRECISION = os.environ.get('COMPILED_INFERENCE_PRECISION', 'float32')
@@ -0,0 +1,399 @@
+import os
+import shutil
+import fcntl
+import logging
+from collections import deque
+from datetime import datetime
+from contextlib import contextmanager
+
+import numpy as np
+from sqlalchemy import func, cast, case, extract, BigInteger
+
+from config import FEATURE_STORE_PATH
+from models import Game
+from app import db
+
+# Column layout of every season partition. Each column is stored as its own
+# .npy file so it can be memory-mapped independently.
+COLUMNS = {
+    'game_id': np.int64,
+    'date': 'datetime64[s]',
+    'home_team_id': np.int32,
+    'away_team_id': np.int32,
+    'home_score': np.int32,
+    'away_score': np.int32,
+    'home_avg_score': np.float32,
+    'away_avg_score': np.float32,
+}
+
+# Number of recent home and away games used for the form features
+FORM_WINDOW = 5
+
+# Default form value when a team has no history yet
+DEFAULT_AVG_SCORE = 2.5
+
+# Weight of the home score in the per-game score checksum used for change detection
+SCORE_CHECKSUM_BASE = 1000
+
+# Games with a final result, the only ones kept in the store
+_SETTLED = (Game.home_score.isnot(None), Game.away_score.isnot(None))
+
+# SQL equivalent of season_of
+_SEASON = extract('year', Game.date) - case((extract('month', Game.date) < 7, 1), else_=0)
+
+# Per-game checksum term; 64-bit so it cannot overflow integer columns (int4 on Postgres)
+_CHECKSUM_TERM = cast(Game.id, BigInteger) * (
+    cast(Game.home_score, BigInteger) * SCORE_CHECKSUM_BASE + cast(Game.away_score, BigInteger)
+)
+
+
+def season_of(date):
+    """Return the season a game belongs to (the year the season started in July)."""
+    return date.year if date.month >= 7 else date.year - 1
+
+
+def seasons_of(dates):
+    """Vectorized season_of for an array of datetime64 values."""
+    dates = np.asarray(dates, dtype='datetime64[s]')
+    years = dates.astype('datetime64[Y]').astype(np.int32) + 1970
+    months = dates.astype('datetime64[M]').astype(np.int32) % 12 + 1
+    return years - (months < 7)
+
+
+class FeatureStore:
+    """
+    Columnar on-disk store of settled games and their derived features.
+
+    Game history is partitioned by season into directories of .npy columns
+    (``season=2023/home_score.npy`` ...). Partitions are read with
+    ``mmap_mode='r'`` so reading a season is zero-copy, and new or corrected
+    results are written by rewriting only the seasons they affect.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or FEATURE_STORE_PATH
+
+    def _partition_path(self, season):
+        return os.path.join(self.root, f'season={season}')
+
+    @contextmanager
+    def _lock(self):
+        """Exclusive lock so concurrent workers don't write the same partition."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def seasons(self):
+        """List the seasons present in the store, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        seasons = []
+        for name in os.listdir(self.root):
+            if name.startswith('season=') and '.' not in name:
+                seasons.append(int(name.split('=', 1)[1]))
+        return sorted(seasons)
+
+    def load_season(self, season):
+        """Return the columns of one season as read-only memory-mapped arrays."""
+        path = self._partition_path(season)
+        return {
+            column: np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r')
+            for column in COLUMNS
+        }
+
+    def iter_partitions(self, seasons=None):
+        """Yield (season, columns) pairs without copying any data."""
+        for season in self.seasons():
+            if seasons is None or season in seasons:
+                yield season, self.load_season(season)
+
+    def load(self, seasons=None, before=None):
+        """
+        Load the requested seasons as one set of columns in date order.
+
+        Args:
+            seasons: Optional iterable of seasons to include. Defaults to all.
+            before: Optional datetime; only games played strictly before it are returned.
+
+        Returns:
+            dict: Column name -> numpy array.
+        """
+        parts = [columns for _, columns in self.iter_partitions(seasons)]
+        if not parts:
+            return _empty_columns()
+
+        if len(parts) == 1:
+            data = parts[0]
+        else:
+            data = {column: np.concatenate([part[column] for part in parts]) for column in COLUMNS}
+
+        if before is not None:
+            # Partitions are sorted by date, so a point-in-time cut is a prefix slice
+            end = int(np.searchsorted(data['date'], np.datetime64(before, 's'), side='left'))
+            data = {column: values[:end] for column, values in data.items()}
+
+        return data
+
+    def snapshot(self):
+        """Return a short identifier of the current store contents."""
+        try:
+            with open(os.path.join(self.root, 'snapshot')) as snapshot_file:
+                return snapshot_file.read().strip()
+        except OSError:
+            return _snapshot_of(self.load())
+
+    def sync(self):
+        """
+        Bring the store in line with the settled games in the database.
+
+        New results, corrected scores and removed games are detected by
+        comparing the count, latest id and a checksum over (id, home score,
+        away score). Only games from the latest stored day on are read when
+        the earlier history is unchanged; otherwise per-season checksums
+        locate the first changed season and reading starts there. Rows are
+        recomputed from the first difference, so only the seasons from that
+        point onwards are rewritten.
+
+        Returns:
+            int: Number of rows added, recomputed or removed.
+        """
+        # Cheap check without the lock first; most calls find nothing to do
+        if _database_snapshot() == self.snapshot():
+            return 0
+
+        with self._lock():
+            # Another worker may have synced while we waited for the lock
+            if _database_snapshot() == self.snapshot():
+                return 0
+
+            stored = self.load()
+            changed_from = _changed_from(stored)
+
+            # Read plain column tuples instead of materializing ORM objects
+            query = db.session.query(
+                Game.id, Game.date, Game.home_team_id, Game.away_team_id,
+                Game.home_score, Game.away_score
+            ).filter(*_SETTLED)
+            kept = 0
+            if changed_from is not None:
+                query = query.filter(Game.date >= changed_from)
+                kept = int(np.searchsorted(stored['date'], np.datetime64(changed_from, 's'), side='left'))
+            rows = query.order_by(Game.date, Game.id).all()
+
+            start = kept + _first_difference(rows, {column: values[kept:] for column, values in stored.items()})
+            if start < len(stored['game_id']):
+                logging.info("Changed or backfilled games found, recomputing feature store from "
+                             f"season {seasons_of(stored['date'][start:start + 1])[0]}")
+
+            prefix = {column: values[:start] for column, values in stored.items()}
+            data = _build_columns(rows[start - kept:], prefix)
+
+            changed_seasons = set(seasons_of(data['date'][start:]).tolist())
+            changed_seasons |= set(seasons_of(stored['date'][start:]).tolist())
+            self._write_seasons(data, changed_seasons)
+            self._write_snapshot(_snapshot_of(data))
+
+            return max(len(data['game_id']), len(stored['game_id'])) - start
+
+    def rebuild(self):
+        """Drop every partition and rebuild the store from the database."""
+        with self._lock():
+            for season in self.seasons():
+                shutil.rmtree(self._partition_path(season))
+            if os.path.exists(os.path.join(self.root, 'snapshot')):
+                os.remove(os.path.join(self.root, 'snapshot'))
+        return self.sync()
+
+    def _write_seasons(self, data, seasons):
+        """Rewrite the given season partitions from `data`, dropping seasons left without games."""
+        data_seasons = seasons_of(data['date'])
+        for season in seasons:
+            mask = data_seasons == season
+            if mask.any():
+                self._write_partition(int(season), {column: values[mask] for column, values in data.items()})
+            else:
+                shutil.rmtree(self._partition_path(season), ignore_errors=True)
+
+    def _write_snapshot(self, snapshot):
+        """Record the identifier of the written contents, read by the cheap sync check."""
+        tmp_path = os.path.join(self.root, 'snapshot.tmp')
+        with open(tmp_path, 'w') as snapshot_file:
+            snapshot_file.write(snapshot)
+        os.replace(tmp_path, os.path.join(self.root, 'snapshot'))
+
+    def _write_partition(self, season, columns):
+        """Atomically replace one season partition."""
+        path = self._partition_path(season)
+        tmp_path = path + '.tmp'
+        old_path = path + '.old'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        for column, dtype in COLUMNS.items():
+            np.save(os.path.join(tmp_path, f'{column}.npy'), np.ascontiguousarray(columns[column], dtype=dtype))
+
+        if os.path.isdir(path):
+            shutil.rmtree(old_path, ignore_errors=True)
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _database_snapshot(before=None):
+    """Snapshot identifier of the settled games in the database, from one aggregate query."""
+    query = db.session.query(func.count(Game.id), func.max(Game.id), func.sum(_CHECKSUM_TERM)).filter(*_SETTLED)
+    if before is not None:
+        query = query.filter(Game.date < before)
+    return _format_snapshot(*query.one())
+
+
+def _changed_from(stored):
+    """
+    Earliest date from which the database may differ from the store, or None to read everything.
+
+    The common case, new results after the latest stored day, is confirmed
+    with one aggregate over the earlier games. Otherwise the first season
+    whose snapshot differs is looked up with one grouped aggregate.
+    """
+    if not len(stored['date']):
+        return None
+
+    last_day = stored['date'][-1].astype('datetime64[D]')
+    last_day_start = datetime.combine(last_day.item(), datetime.min.time())
+    before = int(np.searchsorted(stored['date'], last_day, side='left'))
+    if _database_snapshot(last_day_start) == _snapshot_of({column: values[:before] for column, values in stored.items()}):
+        return last_day_start
+
+    database_seasons = {
+        int(season): _format_snapshot(count, last_game_id, checksum)
+        for season, count, last_game_id, checksum in db.session.query(
+            _SEASON, func.count(Game.id), func.max(Game.id), func.sum(_CHECKSUM_TERM)
+        ).filter(*_SETTLED).group_by(_SEASON).all()
+    }
+    seasons = seasons_of(stored['date'])
+    stored_seasons = {
+        int(season): _snapshot_of({column: values[seasons == season] for column, values in stored.items()})
+        for season in np.unique(seasons)
+    }
+
+    changed = [
+        season for season in set(database_seasons) | set(stored_seasons)
+        if database_seasons.get(season) != stored_seasons.get(season)
+    ]
+    return datetime(min(changed), 7, 1) if changed else None
+
+
+def _format_snapshot(count, last_game_id, checksum):
+    return f'{count}-{last_game_id or 0}-{int(checksum or 0) % 2 ** 32:08x}'
+
+
+def _snapshot_of(data):
+    """Snapshot identifier of stored columns, matching the database aggregate used by sync."""
+    game_ids = data['game_id'].astype(np.int64)
+    scores = data['home_score'].astype(np.int64) * SCORE_CHECKSUM_BASE + data['away_score'].astype(np.int64)
+    # Only the sum modulo 2**32 is kept, so reducing every term first keeps the numpy sum from overflowing
+    return _format_snapshot(
+        len(game_ids),
+        int(game_ids.max()) if len(game_ids) else 0,
+        int(np.sum((game_ids * scores) % 2 ** 32))
+    )
+
+
+def _first_difference(rows, stored):
+    """Index of the first row (in date order) where the database and the store disagree."""
+    n = min(len(rows), len(stored['game_id']))
+    if not n:
+        return 0
+
+    differs = np.zeros(n, dtype=bool)
+    for index, column in enumerate(('game_id', 'date', 'home_team_id', 'away_team_id', 'home_score', 'away_score')):
+        values = [row[index] for row in rows[:n]]
+        if column == 'date':
+            values = np.array(values, dtype='datetime64[s]')
+        differs |= np.asarray(values) != stored[column][:n]
+
+    mismatches = np.flatnonzero(differs)
+    return int(mismatches[0]) if len(mismatches) else n
+
+
+def _empty_columns():
+    return {column: np.empty(0, dtype=dtype) for column, dtype in COLUMNS.items()}
+
+
+class _FormHistory:
+    """Recent home and away scores of every team, replayed game by game."""
+
+    def __init__(self, last_n_games=FORM_WINDOW):
+        self.last_n_games = last_n_games
+        self.home = {}
+        self.away = {}
+
+    def form(self, team_id):
+        scores = list(self.home.get(team_id, ())) + list(self.away.get(team_id, ()))
+        return sum(scores) / len(scores) if scores else DEFAULT_AVG_SCORE
+
+    def record(self, home_team_id, away_team_id, home_score, away_score):
+        self.home.setdefault(home_team_id, deque(maxlen=self.last_n_games)).append(home_score)
+        self.away.setdefault(away_team_id, deque(maxlen=self.last_n_games)).append(away_score)
+
+    def replay(self, columns):
+        for game in zip(
+            columns['home_team_id'].tolist(), columns['away_team_id'].tolist(),
+            columns['home_score'].tolist(), columns['away_score'].tolist()
+        ):
+            self.record(*game)
+        return self
+
+
+def team_forms(data, last_n_games=FORM_WINDOW):
+    """
+    Current form of every team after the last game in `data`, as used for upcoming fixtures.
+
+    Returns:
+        dict: Team id -> average score; teams without games are missing (use DEFAULT_AVG_SCORE).
+    """
+    history = _FormHistory(last_n_games).replay(data)
+    return {team_id: history.form(team_id) for team_id in set(history.home) | set(history.away)}
+
+
+def _build_columns(rows, stored):
+    """
+    Compute point-in-time form features for new rows and append them to stored columns.
+
+    Features for a game only use games played before it, by replaying the
+    stored history to rebuild each team's recent home and away scores.
+    """
+    history = _FormHistory().replay(stored)
+
+    new = {column: [] for column in COLUMNS}
+    for game_id, date, home_team_id, away_team_id, home_score, away_score in rows:
+        new['game_id'].append(game_id)
+        new['date'].append(np.datetime64(date, 's'))
+        new['home_team_id'].append(home_team_id)
+        new['away_team_id'].append(away_team_id)
+        new['home_score'].append(home_score)
+        new['away_score'].append(away_score)
+        new['home_avg_score'].append(history.form(home_team_id))
+        new['away_avg_score'].append(history.form(away_team_id))
+        history.record(home_team_id, away_team_id, home_score, away_score)
+
+    return {
+        column: np.concatenate([stored[column], np.array(new[column], dtype=dtype)])
+        for column, dtype in COLUMNS.items()
+    }
+
+
+def sync_feature_store():
+    """Bring the default feature store up to date with the settled games."""
+    try:
+        changed = FeatureStore().sync()
+        if changed:
+            logging.info(f"Feature store updated, {changed} games written")
+        return changed
+    except Exception as e:
+        logging.error(f"Error updating feature store: {str(e)}")
+        return 0
@@ -0,0 +1,130 @@
+import uuid
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from config import JOB_WORKERS, JOB_HISTORY_SIZE
+from app import db
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+
+class Job:
+    """A background task with progress that clients can poll."""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0
+        self.total = None
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def update(self, progress=None, total=None, message=None):
+        """Report progress from inside the running task."""
+        if progress is not None:
+            self.progress = progress
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'key': self.key,
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class JobRunner:
+    """
+    Runs tasks on a small in-process thread pool, outside the request cycle.
+
+    Submitting a task while another one with the same key is still queued or
+    running returns the existing job instead of starting a duplicate.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, history_size=JOB_HISTORY_SIZE):
+        self.app = None
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+
+    def submit(self, key, task, *args, **kwargs):
+        """
+        Queue `task(job, *args, **kwargs)` to run inside an application context.
+
+        Returns:
+            tuple: (Job, created) where created is False for a deduplicated submission.
+        """
+        with self._lock:
+            existing = self._active.get(key)
+            if existing and existing.active:
+                return existing, False
+
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._prune()
+
+        self._executor.submit(self._run, job, task, args, kwargs)
+        return job, True
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def active(self, key):
+        """Return the queued or running job for `key`, if any."""
+        job = self._active.get(key)
+        return job if job and job.active else None
+
+    def _run(self, job, task, args, kwargs):
+        job.status = RUNNING
+        with self.app.app_context():
+            try:
+                job.result = task(job, *args, **kwargs)
+                job.status = FINISHED
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Background job {job.key} failed: {str(e)}")
+                job.error = str(e)
+                job.status = FAILED
+            finally:
+                job.finished_at = datetime.utcnow()
+                with self._lock:
+                    if self._active.get(job.key) is job:
+                        del self._active[job.key]
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the history size."""
+        finished = [job for job in self._jobs.values() if not job.active]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(0, len(self._jobs) - self.history_size)]:
+            del self._jobs[job.id]
+
+
+job_runner = JobRunner()
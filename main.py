@@ -1,4 +1,8 @@
-from app import app  # noqa: F401
+from app import app
+from season_stats import start_season_stats_scheduler
+
+# Only the web server refreshes season statistics; scripts importing app (e.g. backtest.py) don't
+start_season_stats_scheduler(app)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -68,3 +68,25 @@ class Prediction(db.Model):
         
         # Return average error (lower is better)
         return (home_error + away_error) / 2
+
+class PredictionMemo(db.Model):
+    """Memoized prediction for a fixture under a given model and feature snapshot."""
+    # Keyed on the fixture rather than the game row, which has no unique constraint,
+    # so workers racing on a new fixture cannot both store a game and a prediction
+    __table_args__ = (
+        db.UniqueConstraint('home_team_id', 'away_team_id', 'date', 'model_version', 'feature_snapshot'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    home_team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    away_team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    model_version = db.Column(db.String(50), nullable=False)
+    feature_snapshot = db.Column(db.String(50), nullable=False)
+    prediction_id = db.Column(db.Integer, db.ForeignKey('prediction.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    prediction = db.relationship('Prediction')
+    
+    def __repr__(self):
+        return f'<PredictionMemo {self.home_team_id} vs {self.away_team_id} on {self.date} {self.feature_snapshot}>'
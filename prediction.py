@@ -3,9 +3,40 @@ import pandas as pd
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from models import Game, Team, Prediction
+from sqlalchemy.exc import IntegrityError
+from models import Game, Team, Prediction, PredictionMemo
 from app import db
+from feature_store import FeatureStore, sync_feature_store, team_forms, season_of, seasons_of, DEFAULT_AVG_SCORE
+from season_stats import load_season_stats
+from compiled_forest import compile_model
+from config import COMPILED_INFERENCE, COMPILED_INFERENCE_PRECISION
+
+# Bump whenever the model or its features change, so memoized predictions are recomputed
+MODEL_VERSION = "rf-100-v3"
+
+# Home field advantage factor used when there is too little data to train (simplified)
+HOME_ADVANTAGE = 0.2
+
+# Trained model and team forms shared by requests in this process, keyed on the feature store snapshot
+_model_cache = {'snapshot': None, 'model': None, 'forms': None}
+_model_lock = threading.Lock()
+
+# Fixtures currently being predicted in this process
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Returned when a prediction cannot be computed; never memoized
+FALLBACK_PREDICTION = {
+    'home_score': 1.0,
+    'away_score': 1.0,
+    'home_win_probability': 0.4,
+    'away_win_probability': 0.4,
+    'draw_probability': 0.2,
+    'confidence': 0.5
+}
 
 # Create a basic prediction model
 def create_prediction_model():
@@ -15,80 +46,127 @@ def create_prediction_model():
     more features and possibly a more complex model.
     """
     try:
-        # Get historical game data
-        games = Game.query.filter(Game.home_score.isnot(None)).all()
-        
-        # If we don't have enough historical data, use a simple model
-        if len(games) < 10:
-            logging.warning("Not enough historical data for robust model. Using simplified predictions.")
-            return None
-            
-        # Prepare data for modeling
-        X = []  # Features
-        y_home = []  # Target: home team score
-        y_away = []  # Target: away team score
-        
-        for game in games:
-            # Get the teams
-            home_team = Team.query.get(game.home_team_id)
-            away_team = Team.query.get(game.away_team_id)
-            
-            # Calculate team stats (oversimplified for demo)
-            home_avg_score = get_team_average_score(home_team.id)
-            away_avg_score = get_team_average_score(away_team.id)
-            
-            # Create feature vector
-            # [home_avg_score, away_avg_score, is_home_game]
-            X.append([home_avg_score, away_avg_score, 1])  # 1 indicates home game
-            
-            # Append target values
-            y_home.append(game.home_score)
-            y_away.append(game.away_score)
-            
-        # Convert to numpy arrays
-        X = np.array(X)
-        y_home = np.array(y_home)
-        y_away = np.array(y_away)
-        
-        # Train models
-        home_model = RandomForestRegressor(n_estimators=100, random_state=42)
-        away_model = RandomForestRegressor(n_estimators=100, random_state=42)
-        
-        home_model.fit(X, y_home)
-        away_model.fit(X, y_away)
-        
-        return {'home_model': home_model, 'away_model': away_model}
+        # Read game history and point-in-time features from the columnar store
+        sync_feature_store()
+        return _train_prediction_model(FeatureStore().load())
         
     except Exception as e:
         logging.error(f"Error creating prediction model: {str(e)}")
         return None
 
-def get_team_average_score(team_id, last_n_games=5):
-    """Calculate the average score for a team based on recent games."""
-    # Get recent games where the team played
-    recent_home_games = Game.query.filter(
-        Game.home_team_id == team_id,
-        Game.home_score.isnot(None)
-    ).order_by(Game.date.desc()).limit(last_n_games).all()
+def _train_prediction_model(data):
+    """Train on loaded feature store columns; returns None with too little data, raises on errors."""
+    # If we don't have enough historical data, use a simple model
+    if len(data['game_id']) < 10:
+        logging.warning("Not enough historical data for robust model. Using simplified predictions.")
+        return None
+        
+    X = build_feature_matrix(
+        data['home_avg_score'],
+        data['away_avg_score'],
+        data['home_team_id'],
+        data['away_team_id'],
+        seasons_of(data['date']),
+        load_season_stats()
+    )
     
-    recent_away_games = Game.query.filter(
-        Game.away_team_id == team_id,
-        Game.away_score.isnot(None)
-    ).order_by(Game.date.desc()).limit(last_n_games).all()
+    return train_models(X, data['home_score'], data['away_score'])
+
+def build_feature_matrix(home_avg_scores, away_avg_scores, home_team_ids, away_team_ids, seasons, season_stats):
+    """
+    Build the model feature matrix, one row per game.
     
-    # Calculate average scores
-    home_scores = [game.home_score for game in recent_home_games]
-    away_scores = [game.away_score for game in recent_away_games]
+    Columns: [home_avg_score, away_avg_score, is_home_game, *home_season_stats, *away_season_stats]
     
-    all_scores = home_scores + away_scores
+    `seasons` are the seasons the games are played in. Season statistics are
+    joined from the season before, which cannot include the game's result.
+    Training, inference and the backtest all build their features here.
+    """
+    stats_seasons = np.asarray(seasons, dtype=np.int32) - 1
+    return np.column_stack([
+        np.asarray(home_avg_scores, dtype=np.float64),
+        np.asarray(away_avg_scores, dtype=np.float64),
+        np.ones(len(home_avg_scores)),  # 1 indicates home game
+        season_stats.features_for(home_team_ids, stats_seasons),
+        season_stats.features_for(away_team_ids, stats_seasons)
+    ])
+
+def train_models(X, y_home, y_away, n_estimators=100, n_jobs=None):
+    """Fit the home and away score regressors."""
+    home_model = RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=n_jobs)
+    away_model = RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=n_jobs)
     
-    if all_scores:
-        return sum(all_scores) / len(all_scores)
-    else:
-        # Default value if no historical data
-        return 2.5  # Reasonable default for a sports game
+    home_model.fit(X, np.asarray(y_home))
+    away_model.fit(X, np.asarray(y_away))
+    
+    return {'home_model': home_model, 'away_model': away_model}
+
+def outcome_probabilities(predicted_home_score, predicted_away_score):
+    """
+    Convert predicted scores into home win, away win and draw probabilities.
+    
+    Works on scalars as well as arrays of predictions.
+    """
+    predicted_home_score = np.asarray(predicted_home_score, dtype=np.float64)
+    predicted_away_score = np.asarray(predicted_away_score, dtype=np.float64)
+    
+    # Calculate win probabilities using Poisson distribution (simplified)
+    home_win_prob = 0.5 + (predicted_home_score - predicted_away_score) * 0.1
+    away_win_prob = 0.5 + (predicted_away_score - predicted_home_score) * 0.1
+    
+    # Adjust to ensure they're valid probabilities
+    total = home_win_prob + away_win_prob
+    scale = np.where(total > 1, total, 1)
+    home_win_prob = home_win_prob / scale
+    away_win_prob = away_win_prob / scale
+    
+    draw_prob = 1 - (home_win_prob + away_win_prob)
+    
+    # Ensure probabilities are between 0 and 1
+    return np.clip(home_win_prob, 0, 1), np.clip(away_win_prob, 0, 1), np.clip(draw_prob, 0, 1)
+
+def predict_model_scores(model, features):
+    """Run the home and away score models on a feature matrix."""
+    if 'compiled' in model:
+        predictions = model['compiled'].predict(features)
+        return predictions[:, 0], predictions[:, 1]
+    return model['home_model'].predict(features), model['away_model'].predict(features)
+
+def current_snapshot():
+    """
+    Identify the data the model is trained on: feature store contents and season statistics version.
+    
+    Brings the feature store up to date first; when nothing changed this is
+    one aggregate query and two small file reads.
+    """
+    sync_feature_store()
+    return f"{FeatureStore().snapshot()}:{load_season_stats().version}"
+
+def get_prediction_model(snapshot=None):
+    """
+    Return the feature snapshot, the model trained on it and the current form of every team.
+    
+    The model is only retrained when new results have reached the feature
+    store or the season statistics were refreshed. Pass `snapshot` when it
+    was already taken for this request, so the store is checked only once.
+    Training errors are raised and nothing is cached, so the next call retries.
+    """
+    snapshot = snapshot or current_snapshot()
+    
+    with _model_lock:
+        if _model_cache['snapshot'] != snapshot:
+            # One load serves both training and the form of every team
+            data = FeatureStore().load()
+            model = _train_prediction_model(data)
+            if model and COMPILED_INFERENCE:
+                # Keep only the compact node tables; the sklearn forests are dropped
+                model = compile_model(model, COMPILED_INFERENCE_PRECISION)
+            _model_cache['model'] = model
+            _model_cache['forms'] = team_forms(data)
+            _model_cache['snapshot'] = snapshot
+        return snapshot, _model_cache['model'], _model_cache['forms']
 
-def predict_game(home_team, away_team, venue=None):
+def predict_game(home_team, away_team, venue=None, game_date=None):
     """
     Generate a prediction for a game between two teams.
     
@@ -96,76 +174,192 @@ def predict_game(home_team, away_team, venue=None):
         home_team: The home team object
         away_team: The away team object
         venue: Optional venue information
+        game_date: Optional game date, used to pick the season statistics
         
     Returns:
         Dictionary with prediction results
     """
     try:
-        # Create or load prediction model
-        model = create_prediction_model()
-        
-        # Get team statistics
-        home_avg_score = get_team_average_score(home_team.id)
-        away_avg_score = get_team_average_score(away_team.id)
+        return compute_prediction(home_team, away_team, venue, game_date)
+    except Exception as e:
+        logging.error(f"Error in game prediction: {str(e)}")
+        # Return default prediction in case of error
+        return dict(FALLBACK_PREDICTION)
+
+def compute_prediction(home_team, away_team, venue=None, game_date=None, snapshot=None):
+    """
+    Same as predict_game, but errors are raised instead of replaced by FALLBACK_PREDICTION.
+    
+    `snapshot` is an already taken current_snapshot(), if any.
+    """
+    # Load the cached prediction model
+    _, model, forms = get_prediction_model(snapshot)
+    
+    # Get team statistics
+    home_avg_score = forms.get(home_team.id, DEFAULT_AVG_SCORE)
+    away_avg_score = forms.get(away_team.id, DEFAULT_AVG_SCORE)
+    
+    if model:
+        # Use trained model for prediction
+        season = season_of(game_date or datetime.utcnow())
+        features = build_feature_matrix(
+            [home_avg_score], [away_avg_score], [home_team.id], [away_team.id], [season], load_season_stats()
+        )
+        predicted_home_scores, predicted_away_scores = predict_model_scores(model, features)
+        predicted_home_score = float(predicted_home_scores[0])
+        predicted_away_score = float(predicted_away_scores[0])
+    else:
+        # Simplified prediction if we don't have enough data
+        predicted_home_score = home_avg_score * (1 + HOME_ADVANTAGE)
+        predicted_away_score = away_avg_score * (1 - HOME_ADVANTAGE)
+    
+    # Ensure predictions are reasonable
+    predicted_home_score = max(0, predicted_home_score)
+    predicted_away_score = max(0, predicted_away_score)
+    
+    # Calculate win probabilities
+    home_win_prob, away_win_prob, draw_prob = (
+        float(p) for p in outcome_probabilities(predicted_home_score, predicted_away_score)
+    )
+    
+    # Round predicted scores for display
+    rounded_home_score = round(predicted_home_score, 1)
+    rounded_away_score = round(predicted_away_score, 1)
+    
+    return {
+        'home_score': rounded_home_score,
+        'away_score': rounded_away_score,
+        'home_win_probability': home_win_prob,
+        'away_win_probability': away_win_prob,
+        'draw_probability': draw_prob,
+        'confidence': calculate_confidence_score(home_team.id, away_team.id)
+    }
+
+def predict_scores(home_team_ids, away_team_ids, game_dates):
+    """
+    Predict home and away scores for many fixtures at once.
+    
+    Uses the same model and features as predict_game, with a single model
+    call for all fixtures.
+    
+    Returns:
+        tuple: (predicted home scores, predicted away scores) as numpy arrays
+    """
+    if not len(home_team_ids):
+        return np.empty(0), np.empty(0)
+    
+    _, model, forms = get_prediction_model()
+    
+    home_avg_scores = np.array([forms.get(team_id, DEFAULT_AVG_SCORE) for team_id in home_team_ids])
+    away_avg_scores = np.array([forms.get(team_id, DEFAULT_AVG_SCORE) for team_id in away_team_ids])
+    
+    if model:
+        features = build_feature_matrix(
+            home_avg_scores, away_avg_scores, home_team_ids, away_team_ids,
+            [season_of(game_date) for game_date in game_dates], load_season_stats()
+        )
+        predicted_home_scores, predicted_away_scores = predict_model_scores(model, features)
+    else:
+        predicted_home_scores = home_avg_scores * (1 + HOME_ADVANTAGE)
+        predicted_away_scores = away_avg_scores * (1 - HOME_ADVANTAGE)
+    
+    return np.maximum(predicted_home_scores, 0), np.maximum(predicted_away_scores, 0)
+
+@contextmanager
+def _single_flight(key):
+    """Serialize work on the same key so concurrent identical requests compute once."""
+    with _inflight_lock:
+        entry = _inflight.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _inflight_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _inflight[key]
+
+def get_or_create_prediction(home_team_id, away_team_id, game_date, venue=None):
+    """
+    Return the prediction for a fixture, computing it only once per model and feature snapshot.
+    
+    Predictions are memoized under (fixture, model version, feature snapshot),
+    so repeated requests for the same fixture reuse the stored row until the
+    model or the underlying results change.
+    
+    Returns:
+        Prediction object
+    """
+    with _single_flight((home_team_id, away_team_id, game_date)):
+        snapshot = current_snapshot()
+        memo_key = dict(
+            home_team_id=home_team_id,
+            away_team_id=away_team_id,
+            date=game_date,
+            model_version=MODEL_VERSION,
+            feature_snapshot=snapshot
+        )
+        memo = PredictionMemo.query.filter_by(**memo_key).first()
         
-        # Home field advantage factor (simplified)
-        home_advantage = 0.2
+        if memo:
+            return memo.prediction
         
-        if model:
-            # Use trained model for prediction
-            features = np.array([[home_avg_score, away_avg_score, 1]])  # 1 indicates home game
-            predicted_home_score = float(model['home_model'].predict(features)[0])
-            predicted_away_score = float(model['away_model'].predict(features)[0])
-        else:
-            # Simplified prediction if we don't have enough data
-            predicted_home_score = home_avg_score * (1 + home_advantage)
-            predicted_away_score = away_avg_score * (1 - home_advantage)
+        # Create or get existing game
+        game = Game.query.filter_by(
+            home_team_id=home_team_id,
+            away_team_id=away_team_id,
+            date=game_date
+        ).first()
         
-        # Ensure predictions are reasonable
-        predicted_home_score = max(0, predicted_home_score)
-        predicted_away_score = max(0, predicted_away_score)
+        if not game:
+            game = Game(
+                home_team_id=home_team_id,
+                away_team_id=away_team_id,
+                date=game_date,
+                venue=venue
+            )
+            db.session.add(game)
+            db.session.flush()  # To get the game ID
         
-        # Calculate win probabilities using Poisson distribution (simplified)
-        home_win_prob = 0.5 + (predicted_home_score - predicted_away_score) * 0.1
-        away_win_prob = 0.5 + (predicted_away_score - predicted_home_score) * 0.1
+        # Generate prediction
+        home_team = Team.query.get(home_team_id)
+        away_team = Team.query.get(away_team_id)
         
-        # Adjust to ensure they're valid probabilities
-        if home_win_prob + away_win_prob > 1:
-            total = home_win_prob + away_win_prob
-            home_win_prob = home_win_prob / total
-            away_win_prob = away_win_prob / total
+        try:
+            prediction_results = compute_prediction(home_team, away_team, venue, game_date, snapshot)
+            memoize = True
+        except Exception as e:
+            # Store the fallback for this request, but compute it again next time
+            logging.error(f"Error in game prediction: {str(e)}")
+            prediction_results = dict(FALLBACK_PREDICTION)
+            memoize = False
         
-        draw_prob = 1 - (home_win_prob + away_win_prob)
+        prediction = Prediction(
+            game_id=game.id,
+            predicted_home_score=prediction_results["home_score"],
+            predicted_away_score=prediction_results["away_score"],
+            home_win_probability=prediction_results["home_win_probability"],
+            away_win_probability=prediction_results["away_win_probability"],
+            draw_probability=prediction_results["draw_probability"]
+        )
+        db.session.add(prediction)
         
-        # Ensure probabilities are between 0 and 1
-        home_win_prob = max(0, min(1, home_win_prob))
-        away_win_prob = max(0, min(1, away_win_prob))
-        draw_prob = max(0, min(1, draw_prob))
+        if not memoize:
+            db.session.commit()
+            return prediction
         
-        # Round predicted scores for display
-        rounded_home_score = round(predicted_home_score, 1)
-        rounded_away_score = round(predicted_away_score, 1)
+        db.session.flush()
+        db.session.add(PredictionMemo(prediction_id=prediction.id, **memo_key))
         
-        return {
-            'home_score': rounded_home_score,
-            'away_score': rounded_away_score,
-            'home_win_probability': home_win_prob,
-            'away_win_probability': away_win_prob,
-            'draw_probability': draw_prob,
-            'confidence': calculate_confidence_score(home_team.id, away_team.id)
-        }
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker stored the same fixture first; our game and prediction are rolled back
+            db.session.rollback()
+            return PredictionMemo.query.filter_by(**memo_key).one().prediction
         
-    except Exception as e:
-        logging.error(f"Error in game prediction: {str(e)}")
-        # Return default prediction in case of error
-        return {
-            'home_score': 1.0,
-            'away_score': 1.0,
-            'home_win_probability': 0.4,
-            'away_win_probability': 0.4,
-            'draw_probability': 0.2,
-            'confidence': 0.5
-        }
+        return prediction
 
 def calculate_confidence_score(home_team_id, away_team_id):
     """
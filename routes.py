@@ -1,30 +1,42 @@
-from flask import render_template, request, jsonify, redirect, url_for, flash
+from flask import render_template, request, jsonify, redirect, url_for, flash, make_response, session
 from app import db
 from models import Team, Game, Prediction
-from prediction import predict_game
+from prediction import get_or_create_prediction, current_snapshot, MODEL_VERSION
 from datetime import datetime, timedelta
 import pandas as pd
 import os
 import logging
 from sportmonks_api import SportmonksAPI
-from config import DEFAULT_LEAGUES
+from config import DEFAULT_LEAGUES, SPORTMONKS_API_TOKEN, MAX_SIMULATIONS
+from feature_store import sync_feature_store
+from cache import response_cache
+from jobs import job_runner, FAILED
+from simulation import simulate_division
 
 def init_routes(app):
     @app.route("/")
+    @response_cache.cached("team", "game", "prediction", unless=lambda: job_runner.active("team-sync"))
     def index():
         """Home page with prediction form."""
         # Get all teams for the dropdown selectors
         teams = Team.query.order_by(Team.name).all()
+        sync_job = job_runner.active("team-sync")
         
-        # If no teams exist in the database, load from CSV
-        if not teams:
-            load_initial_data()
+        # If no teams exist in the database, load them (from the API in the background)
+        if not teams and not sync_job:
+            sync_job = load_initial_data()
             teams = Team.query.order_by(Team.name).all()
         
         # Get recent predictions for the sidebar
         recent_predictions = Prediction.query.order_by(Prediction.created_at.desc()).limit(5).all()
-            
-        return render_template("index.html", teams=teams, recent_predictions=recent_predictions)
+        
+        response = make_response(render_template(
+            "index.html", teams=teams, recent_predictions=recent_predictions, sync_job=sync_job
+        ))
+        if sync_job:
+            # The page shows sync progress, so it must not be cached
+            response.cache_control.no_store = True
+        return response
 
     @app.route("/predict", methods=["POST"])
     def predict():
@@ -44,43 +56,8 @@ def init_routes(app):
                 flash("Home and away teams must be different.", "danger")
                 return redirect(url_for("index"))
                 
-            # Create or get existing game
-            existing_game = Game.query.filter_by(
-                home_team_id=home_team_id,
-                away_team_id=away_team_id,
-                date=game_date
-            ).first()
-            
-            if existing_game:
-                game = existing_game
-            else:
-                game = Game(
-                    home_team_id=home_team_id,
-                    away_team_id=away_team_id,
-                    date=game_date,
-                    venue=venue
-                )
-                db.session.add(game)
-                db.session.flush()  # To get the game ID
-            
-            # Generate prediction
-            home_team = Team.query.get(home_team_id)
-            away_team = Team.query.get(away_team_id)
-            
-            prediction_results = predict_game(home_team, away_team, venue)
-            
-            # Save prediction
-            prediction = Prediction(
-                game_id=game.id,
-                predicted_home_score=prediction_results["home_score"],
-                predicted_away_score=prediction_results["away_score"],
-                home_win_probability=prediction_results["home_win_probability"],
-                away_win_probability=prediction_results["away_win_probability"],
-                draw_probability=prediction_results["draw_probability"]
-            )
-            
-            db.session.add(prediction)
-            db.session.commit()
+            # Reuse the stored prediction unless the model or its inputs changed
+            prediction = get_or_create_prediction(home_team_id, away_team_id, game_date, venue)
             
             # Redirect to prediction result page
             return redirect(url_for("prediction_detail", prediction_id=prediction.id))
@@ -92,6 +69,7 @@ def init_routes(app):
             return redirect(url_for("index"))
 
     @app.route("/prediction/<int:prediction_id>")
+    @response_cache.cached("team", "game", "prediction")
     def prediction_detail(prediction_id):
         """Display detailed prediction results."""
         prediction = Prediction.query.get_or_404(prediction_id)
@@ -168,6 +146,7 @@ def init_routes(app):
         return render_template("about.html")
 
     @app.route("/api/predictions", methods=["GET"])
+    @response_cache.cached("team", "game", "prediction")
     def api_predictions():
         """API endpoint to get prediction data for charts."""
         days = request.args.get("days", 30, type=int)
@@ -199,108 +178,178 @@ def init_routes(app):
             
         return jsonify(prediction_data)
 
+    @app.route("/api/simulation", methods=["GET"])
+    @response_cache.cached("team", "game", vary=lambda: f"{MODEL_VERSION}:{current_snapshot()}")
+    def api_simulation():
+        """API endpoint with title, top-4 and relegation odds from a season simulation."""
+        division = request.args.get("division")
+        if not division:
+            return jsonify({"error": "The division parameter is required"}), 400
+        
+        season = request.args.get("season", type=int)
+        simulations = request.args.get("simulations", 100000, type=int)
+        simulations = max(1, min(simulations, MAX_SIMULATIONS))
+        seed = request.args.get("seed", type=int)
+        
+        result = simulate_division(division, season=season, n_simulations=simulations, seed=seed)
+        if result is None:
+            return jsonify({"error": f"No teams found in division {division}"}), 404
+        
+        return jsonify(result)
+
     @app.route("/fetch-teams-api", methods=["GET"])
     def fetch_teams_api():
-        """Frissíti a csapatokat a Sportmonks API-ból."""
-        try:
-            api = SportmonksAPI()
-            teams_data = api.fetch_teams_for_prediction()
-            
-            if not teams_data:
-                flash("Nem sikerült adatokat lekérni a Sportmonks API-ból. Ellenőrizd az API tokent.", "danger")
-                return redirect(url_for("index"))
-            
-            # Mentjük az új csapatokat
-            count_new = 0
-            for team_data in teams_data:
-                # Ellenőrizzük, hogy már létezik-e a csapat
-                existing_team = Team.query.filter_by(name=team_data["name"]).first()
-                
-                if not existing_team:
-                    team = Team(
-                        name=team_data["name"],
-                        abbreviation=team_data["abbreviation"],
-                        division=team_data["division"],
-                        conference=team_data["conference"]
-                    )
-                    db.session.add(team)
-                    count_new += 1
+        """Elindítja a csapatok frissítését a Sportmonks API-ból a háttérben."""
+        job, created = job_runner.submit("team-sync", sync_teams_from_api)
+        
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify(dict(job.to_dict(), progress_url=url_for("job_status", job_id=job.id))), 202
+        
+        if created:
+            flash("A csapatok frissítése elindult a háttérben.", "info")
+        else:
+            flash("A csapatok frissítése már folyamatban van.", "info")
+        return redirect(url_for("index"))
+
+    @app.route("/jobs/<job_id>", methods=["GET"])
+    def job_status(job_id):
+        """Háttérfeladat állapota és haladása."""
+        job = job_runner.get(job_id)
+        if job is None:
+            return jsonify({"error": "Ismeretlen feladat"}), 404
+        
+        # A befejezett feladat eredményét egyszer jelezzük, az újratöltött oldal megjeleníti
+        reported_jobs = session.get("reported_jobs", [])
+        if not job.active and job.id not in reported_jobs:
+            if job.status == FAILED:
+                flash(job.error or "Hiba történt a háttérfeladat futása közben.", "danger")
+            elif job.message:
+                flash(job.message, "success")
+            session["reported_jobs"] = (reported_jobs + [job.id])[-10:]
+        
+        return jsonify(job.to_dict())
+
+    def sync_teams_from_api(job, initial=False):
+        """
+        Csapatok lekérése a Sportmonks API-ból (háttérfeladatként fut).
+        
+        Args:
+            job: A futó háttérfeladat, ezen keresztül jelezzük a haladást.
+            initial: Első betöltés; ha az API nem ad adatot, a helyi CSV-t használjuk.
+        """
+        job.update(message="Csapatok lekérése a Sportmonks API-ból")
+        api = SportmonksAPI()
+        teams_data = api.fetch_teams_for_prediction(
+            progress=lambda done, total: job.update(progress=done, total=total)
+        )
+        
+        if not teams_data:
+            if not initial:
+                raise RuntimeError("Nem sikerült adatokat lekérni a Sportmonks API-ból. Ellenőrizd az API tokent.")
             
-            db.session.commit()
-            flash(f"{count_new} új csapat sikeresen hozzáadva a Sportmonks API-ból!", "success")
+            # Ha az API nem működik, betöltjük a helyi CSV-ből
+            load_csv_teams()
+            load_sample_games()
+            job.update(message="Csapatok sikeresen betöltve a helyi CSV fájlból")
+            return {"new_teams": Team.query.count()}
+        
+        count_new = save_teams(teams_data)
+        if initial:
+            load_sample_games()
+        
+        job.update(message=f"{count_new} új csapat sikeresen hozzáadva a Sportmonks API-ból!")
+        return {"new_teams": count_new}
+
+    def save_teams(teams_data):
+        """Az új csapatok mentése, a már létezőket kihagyjuk."""
+        existing_names = {name for (name,) in Team.query.with_entities(Team.name)}
+        
+        count_new = 0
+        for team_data in teams_data:
+            # Ellenőrizzük, hogy már létezik-e a csapat
+            if team_data["name"] in existing_names:
+                continue
             
-        except Exception as e:
-            db.session.rollback()
-            logging.error(f"Hiba a Sportmonks API adatok betöltésekor: {str(e)}")
-            flash(f"Hiba történt: {str(e)}", "danger")
+            team = Team(
+                name=team_data["name"],
+                abbreviation=team_data["abbreviation"],
+                division=team_data["division"],
+                conference=team_data["conference"]
+            )
+            db.session.add(team)
+            existing_names.add(team_data["name"])
+            count_new += 1
+        
+        db.session.commit()
+        return count_new
+
+    def load_csv_teams():
+        """Csapatok betöltése a helyi CSV fájlból."""
+        teams_path = os.path.join("data", "teams.csv")
+        teams_df = pd.read_csv(teams_path)
+        
+        for _, row in teams_df.iterrows():
+            team = Team(
+                name=row["name"],
+                abbreviation=row["abbreviation"],
+                division=row.get("division", ""),
+                conference=row.get("conference", "")
+            )
+            db.session.add(team)
+        
+        db.session.commit()
+        logging.info("Csapatok sikeresen betöltve a helyi CSV fájlból")
+
+    def load_sample_games():
+        """Opcionálisan betöltünk minta mérkőzés adatokat."""
+        games_path = os.path.join("data", "sample_game_data.csv")
+        if not os.path.exists(games_path):
+            return
+        
+        games_df = pd.read_csv(games_path)
+        
+        # Lekérjük a csapat azonosítókat
+        team_ids = {name: team_id for team_id, name in Team.query.with_entities(Team.id, Team.name)}
+        
+        for _, row in games_df.iterrows():
+            home_team_id = team_ids.get(row["home_team"])
+            away_team_id = team_ids.get(row["away_team"])
             
-        return redirect(url_for("index"))
+            if home_team_id and away_team_id:
+                # Létrehozzuk a mérkőzést
+                game_date = datetime.strptime(row["date"], "%Y-%m-%d")
+                game = Game(
+                    date=game_date,
+                    home_team_id=home_team_id,
+                    away_team_id=away_team_id,
+                    venue=row.get("venue", ""),
+                    home_score=row.get("home_score"),
+                    away_score=row.get("away_score")
+                )
+                db.session.add(game)
+        
+        db.session.commit()
+        logging.info("Minta mérkőzés adatok sikeresen betöltve")
+        
+        # A lejátszott mérkőzéseket a feature store-ba is felvesszük
+        sync_feature_store()
 
     def load_initial_data():
-        """Load initial team data from CSV files or API."""
+        """
+        Load initial team data from the API or CSV files.
+        
+        With an API token the Sportmonks crawl runs as a background job and
+        the job is returned; otherwise the local CSV files are loaded directly.
+        """
+        if SPORTMONKS_API_TOKEN:
+            job, _ = job_runner.submit("team-sync", sync_teams_from_api, initial=True)
+            return job
+        
         try:
-            # Először próbáljuk meg betölteni az adatokat a Sportmonks API-ból
-            api = SportmonksAPI()
-            teams_data = api.fetch_teams_for_prediction()
-            
-            if teams_data:
-                # API adatok sikeresen lekérve
-                for team_data in teams_data:
-                    team = Team(
-                        name=team_data["name"],
-                        abbreviation=team_data["abbreviation"],
-                        division=team_data["division"],
-                        conference=team_data["conference"]
-                    )
-                    db.session.add(team)
-                
-                logging.info("Csapatok sikeresen betöltve a Sportmonks API-ból")
-            else:
-                # Ha az API nem működik, betöltjük a helyi CSV-ből
-                teams_path = os.path.join("data", "teams.csv")
-                teams_df = pd.read_csv(teams_path)
-                
-                for _, row in teams_df.iterrows():
-                    team = Team(
-                        name=row["name"],
-                        abbreviation=row["abbreviation"],
-                        division=row.get("division", ""),
-                        conference=row.get("conference", "")
-                    )
-                    db.session.add(team)
-                
-                logging.info("Csapatok sikeresen betöltve a helyi CSV fájlból")
-            
-            # Mentjük a csapatokat
-            db.session.commit()
-            
-            # Opcionálisan betöltünk minta mérkőzés adatokat
-            games_path = os.path.join("data", "sample_game_data.csv")
-            if os.path.exists(games_path):
-                games_df = pd.read_csv(games_path)
-                
-                for _, row in games_df.iterrows():
-                    # Lekérjük a csapat azonosítókat
-                    home_team = Team.query.filter_by(name=row["home_team"]).first()
-                    away_team = Team.query.filter_by(name=row["away_team"]).first()
-                    
-                    if home_team and away_team:
-                        # Létrehozzuk a mérkőzést
-                        game_date = datetime.strptime(row["date"], "%Y-%m-%d")
-                        game = Game(
-                            date=game_date,
-                            home_team_id=home_team.id,
-                            away_team_id=away_team.id,
-                            venue=row.get("venue", ""),
-                            home_score=row.get("home_score"),
-                            away_score=row.get("away_score")
-                        )
-                        db.session.add(game)
-                
-                db.session.commit()
-                logging.info("Minta mérkőzés adatok sikeresen betöltve")
-                
+            load_csv_teams()
+            load_sample_games()
             logging.info("Kezdeti adatok sikeresen betöltve")
         except Exception as e:
             db.session.rollback()
             logging.error(f"Hiba a kezdeti adatok betöltésekor: {str(e)}")
+        return None
@@ -0,0 +1,360 @@
+import os
+import json
+import hashlib
+import fcntl
+import time
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from config import DEFAULT_LEAGUES, FEATURE_STORE_PATH, SPORTMONKS_API_TOKEN, SEASON_STATS_REFRESH_INTERVAL
+from feature_store import FeatureStore, season_of
+from sportmonks_api import SportmonksAPI
+from models import Team
+
+# Sportmonks statistic type ids used for the team feature vectors
+GOALS_TYPE_ID = 52
+GOALS_CONCEDED_TYPE_ID = 88
+CLEANSHEET_TYPE_ID = 194
+WIN_TYPE_ID = 214
+DRAW_TYPE_ID = 215
+
+# Order of the values in every per-team feature vector
+SEASON_STAT_FEATURES = [
+    'goals_per_game',
+    'conceded_per_game',
+    'win_rate',
+    'draw_rate',
+    'clean_sheet_rate',
+    'top_scorer_goals',
+]
+
+# Team ids, seasons and feature vectors, stored together so they are always replaced at once
+STATS_FILE = 'season_stats.npz'
+
+_STAT_TYPES = {
+    GOALS_TYPE_ID: 'goals_per_game',
+    GOALS_CONCEDED_TYPE_ID: 'conceded_per_game',
+    WIN_TYPE_ID: 'win_rate',
+    DRAW_TYPE_ID: 'draw_rate',
+    CLEANSHEET_TYPE_ID: 'clean_sheet_rate',
+}
+
+
+class SeasonStats:
+    """Per-team season feature vectors, looked up by (team id, season)."""
+
+    def __init__(self, team_ids, seasons, features, version='0'):
+        self.team_ids = np.asarray(team_ids, dtype=np.int32)
+        self.seasons = np.asarray(seasons, dtype=np.int32)
+        self.features = np.asarray(features, dtype=np.float32).reshape(-1, len(SEASON_STAT_FEATURES))
+        self.version = version
+
+        # Latest row for each team and season, sorted so earlier seasons come first
+        self._rows = {}
+        for row in np.lexsort((self.seasons, self.team_ids)):
+            self._rows.setdefault(int(self.team_ids[row]), []).append((int(self.seasons[row]), int(row)))
+
+    def _row_for(self, team_id, season):
+        """Row of the latest season up to `season` for a team, or None."""
+        match = None
+        for row_season, row in self._rows.get(int(team_id), ()):
+            if season is not None and row_season > season:
+                break
+            match = row
+        return match
+
+    def features_for(self, team_ids, seasons=None):
+        """
+        Feature matrix for the given teams, one row per team id.
+
+        Only statistics of the requested season or earlier are used. A
+        season's totals include every game of that season, so callers pass
+        the season before the game's to avoid leaking its result. Teams
+        without statistics get a row of zeros.
+        """
+        if seasons is None:
+            seasons = [None] * len(team_ids)
+
+        result = np.zeros((len(team_ids), len(SEASON_STAT_FEATURES)), dtype=np.float32)
+        for i, (team_id, season) in enumerate(zip(team_ids, seasons)):
+            row = self._row_for(team_id, None if season is None else int(season))
+            if row is not None:
+                result[i] = self.features[row]
+        return result
+
+
+class SeasonStatsAggregator:
+    """
+    Fetches season statistics and top-scorer tables for the default leagues.
+
+    One statistics request and one top-scorer request is made per season
+    rather than per team. The results are reduced to compact per-team
+    vectors and written next to the feature store, where training and
+    inference read them without calling the API.
+    """
+
+    def __init__(self, api=None, root=None, league_ids=None):
+        self.api = api or SportmonksAPI()
+        self.store = FeatureStore(root)
+        self.root = _stats_dir(root)
+        self.league_ids = league_ids or DEFAULT_LEAGUES
+
+    def is_stale(self, max_age=SEASON_STATS_REFRESH_INTERVAL):
+        refreshed_at = _refreshed_at(self.root)
+        return refreshed_at is None or time.time() - refreshed_at > max_age
+
+    def seasons_to_fetch(self, fetched_season_ids=()):
+        """
+        Return (season id, season start year, finished) for every season to fetch now.
+
+        Games are joined with the statistics of the season before theirs, so
+        every finished season preceding one in the feature store is needed.
+        Finished seasons never change and are skipped once in
+        `fetched_season_ids`; the current season is always refetched.
+        """
+        needed_years = {season - 1 for season in self.store.seasons()}
+
+        seasons = []
+        for league_id in self.league_ids:
+            league = self.api.make_request(f'leagues/{league_id}', {'include': 'currentSeason;seasons'})
+            if isinstance(league, list):
+                league = league[0] if league else None
+            league = league or {}
+
+            current = league.get('currentseason') or league.get('currentSeason')
+            if current and current.get('id'):
+                current_year = _season_year(current)
+                seasons.append((current['id'], current_year, False))
+
+                for season in league.get('seasons') or []:
+                    year = _season_year(season)
+                    if (season.get('id') and season['id'] != current['id'] and season.get('starting_at')
+                            and year < current_year and year in needed_years | {current_year - 1}
+                            and season['id'] not in fetched_season_ids):
+                        seasons.append((season['id'], year, True))
+
+            # Kis szünet a kérések között, hogy ne lépjük túl a rate limitet
+            time.sleep(0.5)
+        return seasons
+
+    def fetch_season(self, season_id):
+        """
+        Fetch one season and reduce it to feature values per team name.
+
+        Returns:
+            dict: Team name -> dict of feature name -> value.
+        """
+        teams = {}
+
+        statistics = self.api.get_season_statistics('teams', season_id, {'include': 'participant;details'}) or []
+        for entry in statistics:
+            name = (entry.get('participant') or {}).get('name')
+            if not name:
+                continue
+            values = teams.setdefault(name, {})
+            for detail in entry.get('details') or []:
+                feature = _STAT_TYPES.get(detail.get('type_id'))
+                if feature:
+                    values[feature] = _stat_value(detail.get('value'), feature)
+
+        topscorers = self.api.get_topscorers(season_id, {'include': 'participant'}) or []
+        for entry in topscorers:
+            name = (entry.get('participant') or {}).get('name')
+            if name:
+                values = teams.setdefault(name, {})
+                values['top_scorer_goals'] = values.get('top_scorer_goals', 0.0) + float(entry.get('total') or 0)
+
+        return teams
+
+    def refresh(self):
+        """
+        Fetch the current season, and finished seasons not fetched yet, and store their vectors.
+
+        Vectors stored earlier are kept unless refetched, so finished seasons
+        are only downloaded once.
+
+        Returns:
+            int: Number of team vectors fetched.
+        """
+        team_ids_by_name = {name: team_id for team_id, name in Team.query.with_entities(Team.id, Team.name)}
+        fetched_season_ids = set(_read_meta(self.root).get('fetched_seasons', []))
+
+        team_ids, seasons, features = [], [], []
+        seen = set()
+        for season_id, year, finished in self.seasons_to_fetch(fetched_season_ids):
+            season_teams = self.fetch_season(season_id)
+            if finished and season_teams:
+                fetched_season_ids.add(season_id)
+
+            for name, values in season_teams.items():
+                team_id = team_ids_by_name.get(name)
+                # Domestic leagues come first in DEFAULT_LEAGUES and take precedence over cups
+                if team_id is None or (team_id, year) in seen:
+                    continue
+                seen.add((team_id, year))
+                team_ids.append(team_id)
+                seasons.append(year)
+                features.append([values.get(feature, 0.0) for feature in SEASON_STAT_FEATURES])
+
+        if not team_ids:
+            logging.warning("No season statistics fetched, keeping previous values")
+            return 0
+        fetched = len(team_ids)
+
+        stored = _read_stats(self.root)
+        for team_id, season, values in zip(stored.team_ids.tolist(), stored.seasons.tolist(), stored.features):
+            if (team_id, season) not in seen:
+                team_ids.append(team_id)
+                seasons.append(season)
+                features.append(values.tolist())
+
+        # Sorted, so identical statistics always give identical arrays and version
+        team_ids = np.array(team_ids, dtype=np.int32)
+        seasons = np.array(seasons, dtype=np.int32)
+        features = np.array(features, dtype=np.float32).reshape(-1, len(SEASON_STAT_FEATURES))
+        order = np.lexsort((seasons, team_ids))
+        team_ids, seasons, features = team_ids[order], seasons[order], features[order]
+        version = _content_version(team_ids, seasons, features)
+
+        os.makedirs(self.root, exist_ok=True)
+        if version != _read_meta(self.root).get('version'):
+            _save(
+                os.path.join(self.root, STATS_FILE),
+                team_id=team_ids,
+                season=seasons,
+                features=features,
+                version=np.array(version)
+            )
+        else:
+            logging.info("Season statistics unchanged, keeping the stored version")
+
+        # Written last, so a new version is only announced once its arrays are in place
+        tmp_meta = os.path.join(self.root, 'meta.json.tmp')
+        with open(tmp_meta, 'w') as meta_file:
+            json.dump({
+                'refreshed_at': time.time(),
+                'version': version,
+                'features': SEASON_STAT_FEATURES,
+                'fetched_seasons': sorted(fetched_season_ids),
+            }, meta_file)
+        os.replace(tmp_meta, os.path.join(self.root, 'meta.json'))
+
+        return fetched
+
+    def refresh_if_stale(self, max_age=SEASON_STATS_REFRESH_INTERVAL):
+        """Refresh unless recently done, skipping if another worker is already refreshing."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                if self.is_stale(max_age):
+                    added = self.refresh()
+                    logging.info(f"Season statistics refreshed for {added} teams")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _season_year(season):
+    """Season start year of a Sportmonks season object."""
+    starting_at = season.get('starting_at')
+    if starting_at:
+        return season_of(datetime.strptime(starting_at[:10], '%Y-%m-%d'))
+    return season_of(datetime.utcnow())
+
+
+def _stats_dir(root=None):
+    return os.path.join(root or FEATURE_STORE_PATH, 'season_stats')
+
+
+def _read_meta(stats_dir):
+    try:
+        with open(os.path.join(stats_dir, 'meta.json')) as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _refreshed_at(stats_dir):
+    return _read_meta(stats_dir).get('refreshed_at')
+
+
+def _content_version(team_ids, seasons, features):
+    """Version derived from the statistics themselves, so unchanged refreshes keep it."""
+    digest = hashlib.sha1()
+    for array in (team_ids, seasons, features):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()[:12]
+
+
+def _save(path, **arrays):
+    """Write arrays into one .npz, replaced in a single rename so readers never mix two versions."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as stats_file:
+        np.savez(stats_file, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _stat_value(value, feature):
+    """Extract a single number from a Sportmonks statistic value."""
+    if not isinstance(value, dict):
+        return float(value or 0)
+
+    value = value.get('all', value)
+    if not isinstance(value, dict):
+        return float(value or 0)
+
+    if feature.endswith('_rate'):
+        return float(value.get('percentage') or 0) / 100
+    return float(value.get('average') or value.get('count') or 0)
+
+
+# Loaded vectors shared by requests in this process, reloaded when refreshed
+_loaded = {'version': None, 'stats': None}
+_loaded_lock = threading.Lock()
+
+
+def load_season_stats(root=None):
+    """Return the stored SeasonStats, empty if nothing was fetched yet."""
+    stats_dir = _stats_dir(root)
+    version = _read_meta(stats_dir).get('version', '0')
+
+    with _loaded_lock:
+        if _loaded['version'] != version or _loaded['stats'] is None:
+            _loaded['stats'] = _read_stats(stats_dir)
+            _loaded['version'] = version
+        return _loaded['stats']
+
+
+def _read_stats(stats_dir):
+    """Read the stored statistics; the version comes from the file itself, so it always matches the arrays."""
+    path = os.path.join(stats_dir, STATS_FILE)
+    if not os.path.exists(path):
+        return SeasonStats([], [], [], '0')
+    with np.load(path) as arrays:
+        return SeasonStats(arrays['team_id'], arrays['season'], arrays['features'], str(arrays['version']))
+
+
+def start_season_stats_scheduler(app, interval=SEASON_STATS_REFRESH_INTERVAL):
+    """Refresh season statistics in a background thread every `interval` seconds."""
+    if not SPORTMONKS_API_TOKEN:
+        logging.info("Sportmonks API token not set, season statistics scheduler disabled")
+        return None
+
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    SeasonStatsAggregator().refresh_if_stale(interval)
+            except Exception as e:
+                logging.error(f"Error refreshing season statistics: {str(e)}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='season-stats-refresh', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,283 @@
+import os
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import SIMULATION_WORKERS
+from models import Game, Team
+from feature_store import season_of
+from prediction import predict_scores
+
+# Simulations handled by one vectorized chunk; bounds memory per worker
+CHUNK_SIZE = 10000
+
+# Below this many simulations the work is done in-process instead of sharding
+MIN_SHARDED_SIMULATIONS = 20000
+
+# Tie-break rules applied after points, per league (division name)
+DEFAULT_TIE_BREAK_RULES = ('goal_difference', 'goals_for')
+TIE_BREAK_RULES = {
+    'La Liga': ('head_to_head', 'goal_difference', 'goals_for'),
+    'Serie A': ('head_to_head', 'goal_difference', 'goals_for'),
+}
+
+# Inverse-CDF sampling is used for goal counts when every expected value is at most this
+MAX_TABULATED_XG = 10.0
+
+# Worker processes shared by all simulations in this process, created on first use
+_pool = {'workers': None, 'executor': None}
+_pool_lock = threading.Lock()
+
+
+def _poisson_goals(rng, xg, n):
+    """
+    Draw Poisson goal counts for every fixture, shape (n, fixtures).
+
+    For football-sized expectations, comparing uniform integers against each
+    fixture's cumulative distribution is considerably faster than rng.poisson.
+    """
+    if not len(xg) or xg.max() > MAX_TABULATED_XG:
+        return rng.poisson(xg, size=(n, len(xg))).astype(np.float32)
+
+    pmf = np.exp(-xg)
+    cdf = pmf.copy()
+    goals = np.zeros((n, len(xg)), dtype=np.uint8)
+    draws = rng.integers(0, 2 ** 32, size=(n, len(xg)), dtype=np.uint32)
+    reached = np.empty((n, len(xg)), dtype=bool)
+
+    k = 0
+    while (1 - cdf).max() > 1e-9:
+        np.greater_equal(draws, np.minimum(cdf * 2 ** 32, 2 ** 32 - 1).astype(np.uint32), out=reached)
+        goals += reached
+        k += 1
+        pmf = pmf * xg / k
+        cdf = cdf + pmf
+
+    return goals.astype(np.float32)
+
+
+def _simulate_chunk(n, rng, base, fixtures, rules):
+    """
+    Simulate `n` seasons at once.
+
+    Returns:
+        tuple: (position counts [team, position], summed final points per team)
+    """
+    base_points, base_goals_for, base_goals_against, base_h2h = base
+    home, away, home_xg, away_xg = fixtures
+    n_teams = len(base_points)
+
+    # One-hot incidence of every fixture's home and away team, so per-team totals are matrix products
+    home_matrix = np.zeros((len(home), n_teams), dtype=np.float32)
+    away_matrix = np.zeros((len(away), n_teams), dtype=np.float32)
+    home_matrix[np.arange(len(home)), home] = 1
+    away_matrix[np.arange(len(away)), away] = 1
+
+    home_goals = _poisson_goals(rng, home_xg, n)
+    away_goals = _poisson_goals(rng, away_xg, n)
+    draws = (home_goals == away_goals).astype(np.float32)
+    home_points = 3 * (home_goals > away_goals).astype(np.float32) + draws
+    away_points = 3 * (away_goals > home_goals).astype(np.float32) + draws
+
+    points = base_points + home_points @ home_matrix + away_points @ away_matrix
+    goals_for = base_goals_for + home_goals @ home_matrix + away_goals @ away_matrix
+    goals_against = base_goals_against + away_goals @ home_matrix + home_goals @ away_matrix
+
+    keys = {
+        'goal_difference': goals_for - goals_against,
+        'goals_for': goals_for,
+    }
+
+    if 'head_to_head' in rules:
+        # Points each team took from every opponent, then summed over opponents level on points
+        # (pairs, simulations) layout keeps every per-fixture update contiguous
+        h2h = np.repeat(base_h2h.reshape(-1, 1), n, axis=1)
+        home_points_by_fixture = np.ascontiguousarray(home_points.T)
+        away_points_by_fixture = np.ascontiguousarray(away_points.T)
+        for f in range(len(home)):
+            h2h[home[f] * n_teams + away[f]] += home_points_by_fixture[f]
+            h2h[away[f] * n_teams + home[f]] += away_points_by_fixture[f]
+        h2h = h2h.reshape(n_teams, n_teams, n).transpose(2, 0, 1)
+        level = points[:, :, None] == points[:, None, :]
+        keys['head_to_head'] = (h2h * level).sum(axis=2)
+
+    # np.lexsort sorts ascending with the last key as primary; a random lottery settles full ties
+    sort_keys = [rng.random((n, n_teams))]
+    sort_keys += [-keys[rule] for rule in reversed(rules)]
+    sort_keys.append(-points)
+    order = np.lexsort(sort_keys, axis=-1)
+
+    positions = np.tile(np.arange(n_teams), n)
+    counts = np.bincount(order.ravel() * n_teams + positions, minlength=n_teams * n_teams)
+    return counts.reshape(n_teams, n_teams), points.sum(axis=0, dtype=np.float64)
+
+
+def _run_shard(args):
+    """Simulate one shard of seasons in chunks. Runs in a worker process."""
+    n, seed, base, fixtures, rules = args
+    rng = np.random.default_rng(seed)
+    n_teams = len(base[0])
+
+    counts = np.zeros((n_teams, n_teams), dtype=np.int64)
+    points = np.zeros(n_teams)
+    for start in range(0, n, CHUNK_SIZE):
+        chunk_counts, chunk_points = _simulate_chunk(min(CHUNK_SIZE, n - start), rng, base, fixtures, rules)
+        counts += chunk_counts
+        points += chunk_points
+    return counts, points
+
+
+def _executor(workers):
+    """Return the long-lived process pool, so simulations don't start processes per call."""
+    with _pool_lock:
+        if _pool['workers'] != workers:
+            if _pool['executor'] is not None:
+                _pool['executor'].shutdown(wait=False)
+            _pool['executor'] = ProcessPoolExecutor(max_workers=workers)
+            _pool['workers'] = workers
+        return _pool['executor']
+
+
+def simulate_season(n_teams, played, remaining, n_simulations=100000, rules=DEFAULT_TIE_BREAK_RULES,
+                    seed=None, workers=None):
+    """
+    Monte Carlo simulation of the rest of a season.
+
+    Args:
+        n_teams: Number of teams, referred to by index 0..n_teams-1.
+        played: (home, away, home_goals, away_goals) arrays of finished games.
+        remaining: (home, away, home_xg, away_xg) arrays of fixtures still to play.
+        n_simulations: Number of simulated seasons.
+        rules: Tie-breakers applied after points, in order.
+        seed: Optional random seed for reproducible results.
+        workers: Worker processes; defaults to SIMULATION_WORKERS (1 runs in-process).
+
+    Returns:
+        tuple: (position probabilities [team, position], expected final points per team)
+    """
+    home, away, home_goals, away_goals = (np.asarray(values) for values in played)
+    home_points = np.where(home_goals > away_goals, 3, np.where(home_goals == away_goals, 1, 0))
+    away_points = np.where(away_goals > home_goals, 3, np.where(home_goals == away_goals, 1, 0))
+
+    base_h2h = np.zeros((n_teams, n_teams), dtype=np.float32)
+    np.add.at(base_h2h, (home, away), home_points)
+    np.add.at(base_h2h, (away, home), away_points)
+    base = (
+        np.bincount(home, home_points, n_teams) + np.bincount(away, away_points, n_teams),
+        np.bincount(home, home_goals, n_teams) + np.bincount(away, away_goals, n_teams),
+        np.bincount(home, away_goals, n_teams) + np.bincount(away, home_goals, n_teams),
+        base_h2h,
+    )
+    base = tuple(values.astype(np.float32) for values in base)
+
+    home, away, home_xg, away_xg = (np.asarray(values) for values in remaining)
+    fixtures = (home.astype(np.intp), away.astype(np.intp), home_xg.astype(np.float64), away_xg.astype(np.float64))
+
+    workers = workers or SIMULATION_WORKERS or os.cpu_count() or 1
+    if n_simulations < MIN_SHARDED_SIMULATIONS:
+        workers = 1
+
+    # Independent random streams per shard
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    sizes = [n_simulations // workers + (1 if i < n_simulations % workers else 0) for i in range(workers)]
+    shards = [(size, shard_seed, base, fixtures, tuple(rules)) for size, shard_seed in zip(sizes, seeds) if size]
+
+    if len(shards) == 1:
+        results = [_run_shard(shards[0])]
+    else:
+        results = list(_executor(workers).map(_run_shard, shards))
+
+    counts = sum(result[0] for result in results)
+    points = sum(result[1] for result in results)
+    return counts / n_simulations, points / n_simulations
+
+
+def simulate_division(division, season=None, n_simulations=100000, top_spots=4, relegation_spots=3, seed=None):
+    """
+    Simulate the rest of a league season from the games in the database.
+
+    Teams are those in `division`. Unscored games in the database are created
+    by visitors asking for predictions, so the remaining fixtures are the
+    future ones, one per pairing not played yet this season. Expected goals
+    come from the prediction model.
+
+    Returns:
+        dict: Title, top and relegation odds and position distribution per team.
+    """
+    if season is None:
+        season = season_of(datetime.utcnow())
+
+    teams = Team.query.filter_by(division=division).with_entities(Team.id, Team.name).order_by(Team.name).all()
+    if not teams:
+        return None
+
+    index_of = {team_id: index for index, (team_id, _) in enumerate(teams)}
+    games = Game.query.with_entities(
+        Game.home_team_id, Game.away_team_id, Game.date, Game.home_score, Game.away_score
+    ).filter(
+        Game.home_team_id.in_(index_of),
+        Game.away_team_id.in_(index_of),
+        Game.date >= datetime(season, 7, 1),
+        Game.date < datetime(season + 1, 7, 1)
+    ).all()
+
+    played = [game for game in games if game.home_score is not None and game.away_score is not None]
+
+    # Every pairing is played once per season; keep the earliest future fixture of the rest
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    scheduled = {(game.home_team_id, game.away_team_id) for game in played}
+    remaining = []
+    for game in sorted(games, key=lambda game: game.date):
+        pairing = (game.home_team_id, game.away_team_id)
+        if (game.home_score is None or game.away_score is None) and game.date >= today and pairing not in scheduled:
+            scheduled.add(pairing)
+            remaining.append(game)
+
+    home_xg, away_xg = predict_scores(
+        [game.home_team_id for game in remaining],
+        [game.away_team_id for game in remaining],
+        [game.date for game in remaining]
+    )
+
+    probabilities, expected_points = simulate_season(
+        len(teams),
+        (
+            np.array([index_of[game.home_team_id] for game in played], dtype=np.intp),
+            np.array([index_of[game.away_team_id] for game in played], dtype=np.intp),
+            np.array([game.home_score for game in played], dtype=np.float64),
+            np.array([game.away_score for game in played], dtype=np.float64),
+        ),
+        (
+            np.array([index_of[game.home_team_id] for game in remaining], dtype=np.intp),
+            np.array([index_of[game.away_team_id] for game in remaining], dtype=np.intp),
+            home_xg,
+            away_xg,
+        ),
+        n_simulations=n_simulations,
+        rules=TIE_BREAK_RULES.get(division, DEFAULT_TIE_BREAK_RULES),
+        seed=seed
+    )
+
+    results = []
+    for index, (team_id, name) in enumerate(teams):
+        results.append({
+            'team_id': team_id,
+            'name': name,
+            'expected_points': float(expected_points[index]),
+            'title_probability': float(probabilities[index, 0]),
+            'top_probability': float(probabilities[index, :top_spots].sum()),
+            'relegation_probability': float(probabilities[index, len(teams) - relegation_spots:].sum()),
+            'positions': probabilities[index].round(6).tolist(),
+        })
+    results.sort(key=lambda team: team['expected_points'], reverse=True)
+
+    return {
+        'division': division,
+        'season': season,
+        'simulations': n_simulations,
+        'played_games': len(played),
+        'remaining_games': len(remaining),
+        'teams': results,
+    }
@@ -130,12 +130,13 @@ class SportmonksAPI:
         """
         return self.make_request(f'topscorers/seasons/{season_id}', params)
     
-    def fetch_teams_for_prediction(self, league_ids=None):
+    def fetch_teams_for_prediction(self, league_ids=None, progress=None):
         """
         Csapatok lekérése a predikciós modellhez.
         
         Args:
             league_ids: A ligák azonosítói. Ha nincs megadva, az alapértelmezett ligákat használja.
+            progress: Opcionális callback(kész, összes), minden liga után meghívva.
             
         Returns:
             list: Feldolgozott csapat adatok.
@@ -145,7 +146,7 @@ class SportmonksAPI:
             
         all_teams = []
         
-        for league_id in league_ids:
+        for index, league_id in enumerate(league_ids):
             params = {'filters': f'league_id:{league_id}'}
             teams = self.get_teams(params)
             
@@ -161,6 +162,9 @@ class SportmonksAPI:
                     }
                     all_teams.append(team_data)
             
+            if progress:
+                progress(index + 1, len(league_ids))
+            
             # Kis szünet a kérések között, hogy ne lépjük túl a rate limitet
             time.sleep(0.5)
             
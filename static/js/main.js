@@ -17,6 +17,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Add event listeners
     addEventListeners();
+    
+    // Start polling background sync jobs
+    initializeSyncJobs();
 });
 
 /**
@@ -235,3 +238,52 @@ function updateConfidenceMeter(confidence) {
         confidenceValue.textContent = formatProbability(confidence, 0);
     }
 }
+
+/**
+ * Run the team sync in the background and show its progress
+ */
+function initializeSyncJobs() {
+    const status = document.getElementById('sync-job-status');
+    if (status) {
+        pollSyncJob(status.getAttribute('data-progress-url'), status);
+    }
+    
+    const fetchButton = document.getElementById('fetch-teams-btn');
+    if (fetchButton) {
+        fetchButton.addEventListener('click', function(e) {
+            e.preventDefault();
+            fetchButton.classList.add('disabled');
+            
+            fetch(fetchButton.href, { headers: { 'Accept': 'application/json' } })
+                .then(response => response.json())
+                .then(job => pollSyncJob(job.progress_url, fetchButton))
+                .catch(error => {
+                    console.error('Error starting team sync:', error);
+                    fetchButton.classList.remove('disabled');
+                });
+        });
+    }
+}
+
+/**
+ * Poll a background job until it finishes, then reload the page.
+ * The server flashes the job's result, which the reloaded page shows.
+ * @param {string} progressUrl - URL of the job status endpoint
+ * @param {HTMLElement} element - Element showing the progress
+ */
+function pollSyncJob(progressUrl, element) {
+    fetch(progressUrl, { headers: { 'Accept': 'application/json' } })
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === 'finished' || job.status === 'failed' || job.error) {
+                window.location.reload();
+                return;
+            }
+            
+            if (job.total) {
+                element.textContent = `Csapatok frissítése... (${job.progress}/${job.total})`;
+            }
+            setTimeout(() => pollSyncJob(progressUrl, element), 1000);
+        })
+        .catch(error => console.error('Error polling sync job:', error));
+}